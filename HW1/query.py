@@ -1,8 +1,12 @@
 import matplotlib.pyplot as plt
 import networkx as nx
 from collections import defaultdict
+import hashlib
+import os
 import sys
 
+from pagerank import PageRank, TopicPageRank
+
 
 def read_nodes(filename):
     node2category = {}
@@ -30,7 +34,46 @@ def create_graph(edges):
     return G
 
 
+def files_hash(filenames):
+    """Return the SHA-1 hex digest of the content of the files
+    """
+    digest = hashlib.sha1()
+    for filename in filenames:
+        with open(filename, 'rb') as file:
+            digest.update(file.read())
+    return digest.hexdigest()
+
+
+def parse_query(query):
+    """Parse a query like 'sports' or 'sports:0.7,politics:0.3' into {category: weight}
+    """
+    weights = {}
+    for term in query.split(','):
+        category, _, weight = term.partition(':')
+        weights[category] = float(weight or 1)
+    return weights
+
+
+def topic_pagerank(nodes_filename, edges_filename, node2category, category2node, edges, topic_dir):
+    """Return the topic-sensitive PageRank of every category, cached in topic_dir for the content of the input files
+    """
+    cache_path = os.path.join(topic_dir, files_hash([nodes_filename, edges_filename]))
+    if os.path.exists(os.path.join(cache_path, 'vectors.npy')):
+        return TopicPageRank.load(cache_path)
+    engine = PageRank(edges, nodes=list(node2category))
+    topics = TopicPageRank.build(engine, category2node)
+    topics.save(cache_path)
+    return topics
+
+
 def main(argv):
+    """
+    python3 query.py NODE_FILE_NAME EDGE_FILE_NAME QUERY [TOPIC_DIR]
+
+    Without TOPIC_DIR, rank the nodes of category QUERY by PageRank. With
+    TOPIC_DIR, rank all nodes by topic-sensitive PageRank for QUERY, a
+    category or weighted categories like sports:0.7,politics:0.3.
+    """
     nodes_filename = argv[1]
     edges_filename = argv[2]
     query = argv[3]
@@ -38,6 +81,25 @@ def main(argv):
     edges = read_edges(edges_filename)
     G = create_graph(edges)
 
+    if len(argv) > 4:
+        topics = topic_pagerank(nodes_filename, edges_filename, node2category, category2node, edges, argv[4])
+        weights = parse_query(query)
+        unknown = [category for category in weights if category not in topics.topic_index]
+        if unknown:
+            sys.exit(f"unknown categories: {', '.join(unknown)}, "
+                     f"categories of {nodes_filename}: {', '.join(topics.topics.tolist())}")
+        pr = topics.query(weights)
+
+        # Print out the result
+        sorted_pr = sorted(zip(topics.nodes.tolist(), pr.tolist()), key=lambda k: k[1], reverse=True)
+        print('No.\tNode\tCategory\tValue')
+        for index, (node, value) in enumerate(sorted_pr):
+            print(index+1, '\t', node, '\t', node2category[node], '\t', value)
+
+        nx.draw(G, with_labels=True)
+        plt.show()
+        return
+
     # Calculate the PageRank with damping parameter = 1
     pr = nx.pagerank(G, alpha=1.0)
 
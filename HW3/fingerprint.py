@@ -0,0 +1,215 @@
+import os
+import shutil
+import sys
+
+import numpy as np
+
+from simrank import build_adjacency, link_structure, parse_intput, read_input
+
+
+class FingerprintIndex(object):
+    """
+    Monte Carlo SimRank from precomputed reverse random-walk fingerprints
+    Reference: D. Fogaras and B. Racz, Scaling link-based similarity search, WWW 2005
+
+    Users take node indices 0..len(user_ids)-1 and ads follow them. For every
+    node the index stores R coupled random walks of L steps over the bipartite
+    user-ad graph. At each step all walks of a round share one random neighbor
+    choice per node, so two walks stay together once they meet. SimRank of a
+    pair is then estimated as the average of C^tau over the rounds, where tau
+    is the first step at which their walks meet.
+
+    Parameters
+    ----------
+    user_ids : numpy.ndarray
+        User id of each user node
+    ad_ids : numpy.ndarray
+        Ad id of each ad node
+    walks : numpy.ndarray
+        Array of shape (num_nodes, R, L) holding the node visited at each step
+    C1 : float
+        A constant between 0 and 1 for user
+    C2 : float
+        A constant between 0 and 1 for ad
+    """
+
+    def __init__(self, user_ids, ad_ids, walks, C1, C2):
+        self.user_ids = user_ids
+        self.ad_ids = ad_ids
+        self.walks = walks
+        self.C1 = C1
+        self.C2 = C2
+
+        num_users = len(user_ids)
+        self.user_index = {user: i for i, user in enumerate(user_ids.tolist())}
+        self.ad_index = {ad: num_users + i for i, ad in enumerate(ad_ids.tolist())}
+
+        # Decay after t steps for walks starting from a user and from an ad
+        steps = np.arange(1, walks.shape[2] + 1)
+        self.user_decay = C1 ** ((steps + 1) // 2) * C2 ** (steps // 2)
+        self.ad_decay = C2 ** ((steps + 1) // 2) * C1 ** (steps // 2)
+
+    @classmethod
+    def build(cls, users, ads, user_links, C1, C2, num_walks=100, length=10, seed=None):
+        """Sample the fingerprints of every user and ad
+
+        Parameters
+        ----------
+        users : set or list
+            All user id
+        ads : set or list
+            All ad id
+        user_links : {user: {ad: link score}}
+            Link information for each user
+        C1 : float
+            A constant between 0 and 1 for user
+        C2 : float
+            A constant between 0 and 1 for ad
+        num_walks : int
+            Number of fingerprints R per node. The standard error of an
+            estimate decays as 1 / sqrt(R).
+        length : int
+            Number of steps L per walk. Meetings after L steps are ignored,
+            which underestimates SimRank by at most C^L.
+        seed : int, optional
+            Seed of the random number generator
+        """
+        user_ids, ad_ids, links = build_adjacency(users, ads, user_links)
+        num_users, num_ads = links.shape
+        num_nodes = num_users + num_ads
+
+        # Bipartite graph over users followed by ads
+        structure = link_structure(links)
+        structure.sort_indices()
+        indptr = np.concatenate([structure.indptr, structure.nnz + structure.T.tocsr().indptr[1:]])
+        indices = np.concatenate([structure.indices + num_users, structure.T.tocsr().indices])
+        degree = np.diff(indptr)
+
+        rng = np.random.default_rng(seed)
+        nodes = np.arange(num_nodes)
+        walks = np.empty((num_nodes, num_walks, length), dtype=np.int32)
+        for r in range(num_walks):
+            position = nodes
+            for t in range(length):
+                # One random neighbor per node, shared by every walk of this round
+                choice = indices[indptr[:-1] + (rng.random(num_nodes) * degree).astype(np.int64)]
+                position = choice[position]
+                walks[:, r, t] = position
+
+        return cls(np.array(user_ids), np.array(ad_ids), walks, C1, C2)
+
+    def save(self, path):
+        """Save the index to a directory of .npy files
+
+        An existing index at path is replaced as a whole, so a reader never
+        sees a partly written index and an index loaded from path can be
+        saved back to it.
+        """
+        arrays = {
+            'walks': self.walks,
+            'user_ids': self.user_ids,
+            'ad_ids': self.ad_ids,
+            'constants': np.array([self.C1, self.C2]),
+        }
+
+        # A loaded index memory-maps the files it was loaded from, which may be the ones
+        # replaced here, so write into a new directory and swap it in when it is complete
+        path = os.path.normpath(path)
+        tmp_path = path + f'.{os.getpid()}.tmp'
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        for name, array in arrays.items():
+            np.save(os.path.join(tmp_path, f'{name}.npy'), array)
+        old_path = path + f'.{os.getpid()}.old'
+        if os.path.exists(path):
+            os.replace(path, old_path)
+        os.replace(tmp_path, path)
+        # Mapped files stay readable after they are removed
+        shutil.rmtree(old_path, ignore_errors=True)
+
+    @classmethod
+    def load(cls, path):
+        """Load an index saved by `save`
+
+        The fingerprints are memory-mapped read-only, so processes that load
+        the same index share its pages instead of holding their own copy.
+        """
+        walks = np.load(os.path.join(path, 'walks.npy'), mmap_mode='r')
+        user_ids = np.load(os.path.join(path, 'user_ids.npy'))
+        ad_ids = np.load(os.path.join(path, 'ad_ids.npy'))
+        C1, C2 = np.load(os.path.join(path, 'constants.npy')).tolist()
+        return cls(user_ids, ad_ids, walks, C1, C2)
+
+    def _lookup(self, kind):
+        if kind == 'user':
+            return self.user_index, self.user_decay, 0, len(self.user_ids)
+        elif kind == 'ad':
+            num_users = len(self.user_ids)
+            return self.ad_index, self.ad_decay, num_users, num_users + len(self.ad_ids)
+        raise ValueError(f'kind must be user or ad, not {kind}')
+
+    def _estimate(self, walk, others, decay):
+        """Average C^tau over the rounds for every walk set in others
+        """
+        meet = others == walk
+        met = meet.any(axis=-1)
+        first = meet.argmax(axis=-1)
+        return np.where(met, decay[first], 0.0).mean(axis=-1)
+
+    def similarity(self, node1, node2, kind):
+        """Estimate the SimRank of two users or two ads
+
+        Parameters
+        ----------
+        node1, node2 : int
+            User ids or ad ids
+        kind : string
+            Specify 'user' for users and 'ad' for ads
+        """
+        index, decay, _, _ = self._lookup(kind)
+        if node1 == node2:
+            return 1.0
+        i, j = index[node1], index[node2]
+        return float(self._estimate(self.walks[i], self.walks[j], decay))
+
+    def top_similar(self, query, kind, k):
+        """Return the k nodes most similar to the query as (node, similarity) pairs
+        """
+        index, decay, start, end = self._lookup(kind)
+        ids = self.user_ids if kind == 'user' else self.ad_ids
+        i = index[query]
+
+        sim = self._estimate(self.walks[i], self.walks[start:end], decay)
+        sim[i - start] = -1.0
+        k = min(k, len(sim) - 1)
+        candidates = np.argpartition(-sim, k - 1)[:k] if k > 0 else np.array([], dtype=int)
+        candidates = candidates[np.lexsort((ids[candidates], -sim[candidates]))]
+        return [(ids[j].item(), sim[j].item()) for j in candidates]
+
+
+def main(argv):
+    """
+    python3 fingerprint.py build INPUT_FILE_NAME INDEX_DIR
+    python3 fingerprint.py query INDEX_DIR user|ad NODE_ID
+    """
+    command = argv[1]
+    C1, C2 = 0.8, 0.8
+    topk = 3
+
+    if command == 'build':
+        input_filename, index_path = argv[2], argv[3]
+        inputs, _, _ = read_input(input_filename)
+        users, ads, user_links, ad_links = parse_intput(inputs)
+        index = FingerprintIndex.build(users, ads, user_links, C1, C2)
+        index.save(index_path)
+    elif command == 'query':
+        index_path, kind, node = argv[2], argv[3], int(argv[4])
+        index = FingerprintIndex.load(index_path)
+        for other, value in index.top_similar(node, kind, topk):
+            print(other, '\t', value)
+    else:
+        print(main.__doc__)
+
+
+if __name__ == "__main__":
+    main(sys.argv)
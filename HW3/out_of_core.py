@@ -0,0 +1,175 @@
+import hashlib
+import json
+import os
+import sys
+
+import numpy as np
+
+from simrank import (build_adjacency, parse_intput, read_input, sort_matrix_query_result,
+                     transition_matrices)
+
+
+def open_matrix(path, size, mode):
+    return np.memmap(path, dtype=np.float32, mode=mode, shape=(size, size))
+
+
+def read_state(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r') as file:
+        return json.load(file)
+
+
+def write_state(path, state):
+    """Write the checkpoint atomically so that a kill never leaves it half written
+    """
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as file:
+        json.dump(state, file)
+    os.replace(tmp_path, path)
+
+
+def graph_hash(user_ids, ad_ids, links):
+    """Return the SHA-1 hex digest of the node ids and the link matrix
+    """
+    links = links.tocsr()
+    links.sort_indices()
+    digest = hashlib.sha1()
+    for array in (user_ids, ad_ids, links.indptr, links.indices, links.data):
+        digest.update(np.ascontiguousarray(array, dtype=np.float64).tobytes())
+    return digest.hexdigest()
+
+
+def update_blocks(sim, other_sim, W, C, block_size):
+    """Compute sim = C * W other_sim W^T one block_size x block_size tile at a time
+
+    Tile (R, S) only reads the entries of other_sim at the rows linked from
+    R and the columns linked from S, converted to float64 one tile at a time,
+    so the resident memory is bounded by the block size and the number of
+    links of a block rather than by the size of the matrices. The product is
+    symmetric, so only the tiles on and above the diagonal are computed and
+    each is also written transposed.
+    """
+    num_rows = sim.shape[0]
+    blocks = []
+    for start in range(0, num_rows, block_size):
+        end = min(start + block_size, num_rows)
+        W_block = W[start:end]
+        needed = np.unique(W_block.indices)
+        blocks.append((start, end, needed, W_block[:, needed]))
+
+    for i, (start, end, needed, W_rows) in enumerate(blocks):
+        for col_start, col_end, col_needed, W_cols in blocks[i:]:
+            other = np.asarray(other_sim[np.ix_(needed, col_needed)], dtype=np.float64)
+            tile = C * (W_rows @ (W_cols @ other.T).T)
+            if col_start == start:
+                tile[np.arange(end - start), np.arange(end - start)] = 1.0
+            sim[start:end, col_start:col_end] = tile
+            sim[col_start:col_end, start:end] = tile.T
+
+
+def simrank_out_of_core(users, ads, user_links, ad_links, iteration, C1, C2, workdir,
+                        block_size=1024, weighted=False):
+    """Implementation of SimRank algorithm with disk-backed similarity matrices
+
+    user_sim and ad_sim are stored as float32 memory-mapped files in workdir
+    and updated one tile of block_size x block_size at a time. The user update only reads
+    ad_sim and the ad update only reads user_sim, so every update can be
+    redone from scratch. A checkpoint is written after each update, and
+    calling the function again with the same workdir resumes a killed run
+    from the last finished update. The checkpoint records a hash of the
+    graph and the parameters, and the run starts over when any of them
+    differ.
+
+    Parameters
+    ----------
+    users : set or list
+        All user id
+    ads : set or list
+        All ad id
+    user_links : {user: {ad: link score}}
+        Link information for each user
+    ad_links : {ad: {user: link score}}
+        Link information for each ad
+    iteration : int
+        Number of iteration
+    C1 : float
+        A constant between 0 and 1 for user
+    C2 : float
+        A constant between 0 and 1 for ad
+    workdir : string
+        Directory holding the matrices and the checkpoint
+    block_size : int
+        Number of rows and columns of the tiles updated at a time
+    weighted : bool
+        Use weighted SimRank transitions, see `transition_matrices`
+
+    Returns
+    -------
+    user_sim, ad_sim : numpy.memmap
+        Read-only similarity matrices whose rows and columns follow
+        sorted(users) and sorted(ads)
+    """
+    user_ids, ad_ids, links = build_adjacency(users, ads, user_links)
+    W_user, W_ad = transition_matrices(links, weighted)
+    num_users, num_ads = links.shape
+    params = {'shape': [num_users, num_ads], 'input': graph_hash(user_ids, ad_ids, links),
+              'C1': C1, 'C2': C2, 'weighted': weighted, 'iteration': iteration}
+
+    os.makedirs(workdir, exist_ok=True)
+    user_path = os.path.join(workdir, 'user_sim.dat')
+    ad_path = os.path.join(workdir, 'ad_sim.dat')
+    state_path = os.path.join(workdir, 'state.json')
+
+    state = read_state(state_path)
+    if state is None or {key: state.get(key) for key in params} != params:
+        # Start over: ad_sim is the identity, user_sim is written by the first update
+        open_matrix(user_path, num_users, 'w+').flush()
+        ad_sim = open_matrix(ad_path, num_ads, 'w+')
+        for start in range(0, num_ads, block_size):
+            end = min(start + block_size, num_ads)
+            ad_sim[np.arange(start, end), np.arange(start, end)] = 1.0
+        ad_sim.flush()
+        del ad_sim
+        state = dict(params, updates=0)
+        write_state(state_path, state)
+
+    # Every iteration is a user update followed by an ad update
+    user_sim = open_matrix(user_path, num_users, 'r+')
+    ad_sim = open_matrix(ad_path, num_ads, 'r+')
+    for update in range(state['updates'], 2 * iteration):
+        if update % 2 == 0:
+            update_blocks(user_sim, ad_sim, W_user, C1, block_size)
+            user_sim.flush()
+        else:
+            update_blocks(ad_sim, user_sim, W_ad, C2, block_size)
+            ad_sim.flush()
+        state['updates'] = update + 1
+        write_state(state_path, state)
+    del user_sim, ad_sim
+
+    return open_matrix(user_path, num_users, 'r'), open_matrix(ad_path, num_ads, 'r')
+
+
+def main(argv):
+    """
+    python3 out_of_core.py INPUT_FILE_NAME WORK_DIR
+    """
+    input_filename = argv[1]
+    workdir = argv[2]
+
+    iteration = 10
+    C1, C2 = 0.8, 0.8
+    topk = 3
+    inputs, query_user, query_ad = read_input(input_filename)
+    users, ads, user_links, ad_links = parse_intput(inputs)
+
+    user_sim, ad_sim = simrank_out_of_core(users, ads, user_links, ad_links, iteration, C1, C2, workdir)
+    result_user = sort_matrix_query_result(user_sim, sorted(users), query_user)
+    result_query = sort_matrix_query_result(ad_sim, sorted(ads), query_ad)
+    print(','.join([str(k) for k, v in result_user[:topk]]))
+    print(','.join([str(k) for k, v in result_query[:topk]]))
+
+
+if __name__ == "__main__":
+    main(sys.argv)
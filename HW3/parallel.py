@@ -0,0 +1,175 @@
+import os
+import sys
+import time
+from multiprocessing import Pool, shared_memory
+
+import numpy as np
+
+from simrank import build_adjacency, parse_intput, read_input, simrank_sparse, transition_matrices
+
+
+# Per-worker state, set once by init_worker so that tasks only carry row ranges
+_worker = {}
+
+
+def attach(name, shape):
+    """Attach to a shared memory block and view it as a float64 array
+    """
+    block = shared_memory.SharedMemory(name=name)
+    return block, np.ndarray(shape, dtype=np.float64, buffer=block.buf)
+
+
+def init_worker(W_user, W_ad, C1, C2, buffers):
+    _worker['W'] = {'user': W_user, 'ad': W_ad}
+    _worker['C'] = {'user': C1, 'ad': C2}
+    _worker['blocks'] = []
+    _worker['arrays'] = {}
+    for key, (name, shape) in buffers.items():
+        block, array = attach(name, shape)
+        _worker['blocks'].append(block)
+        _worker['arrays'][key] = array
+
+
+def propagate(task):
+    """First half of an update: partial[:, rows] = (W[rows] @ other_sim)^T
+
+    The partial product is stored transposed so that `combine` reads it
+    contiguously.
+    """
+    kind, start, end = task
+    other = 'ad' if kind == 'user' else 'user'
+    arrays = _worker['arrays']
+    W = _worker['W'][kind]
+    arrays[kind + '_partial'][:, start:end] = (W[start:end] @ arrays[other + '_sim']).T
+
+
+def combine(task):
+    """Second half of an update: sim[rows] = C * W[rows] @ partial
+    """
+    kind, start, end = task
+    arrays = _worker['arrays']
+    W = _worker['W'][kind]
+    arrays[kind + '_sim'][start:end] = _worker['C'][kind] * (W[start:end] @ arrays[kind + '_partial'])
+
+
+def split_rows(kind, num_rows, block_size):
+    return [(kind, start, min(start + block_size, num_rows)) for start in range(0, num_rows, block_size)]
+
+
+def simrank_parallel(users, ads, user_links, ad_links, iteration, C1, C2, workers=None,
+                     block_size=None, weighted=False):
+    """Implementation of SimRank algorithm over row blocks in a process pool
+
+    Every update of `simrank_sparse` is split into blocks of rows. The
+    similarity matrices and the partial products live in shared memory, so
+    workers read and write them in place and only row ranges are sent to
+    them. Each row is computed exactly as in `simrank_sparse`, so the output
+    is identical to the serial path.
+
+    Parameters
+    ----------
+    users : set or list
+        All user id
+    ads : set or list
+        All ad id
+    user_links : {user: {ad: link score}}
+        Link information for each user
+    ad_links : {ad: {user: link score}}
+        Link information for each ad
+    iteration : int
+        Number of iteration
+    C1 : float
+        A constant between 0 and 1 for user
+    C2 : float
+        A constant between 0 and 1 for ad
+    workers : int, optional
+        Number of worker processes, os.cpu_count() by default
+    block_size : int, optional
+        Number of rows per task. By default each worker gets about four
+        blocks per update.
+    weighted : bool
+        Use weighted SimRank transitions, see `transition_matrices`
+
+    Returns
+    -------
+    user_sim, ad_sim : numpy.ndarray
+        Similarity matrices whose rows and columns follow sorted(users) and
+        sorted(ads)
+    """
+    workers = workers or os.cpu_count()
+    _, _, links = build_adjacency(users, ads, user_links)
+    W_user, W_ad = transition_matrices(links, weighted)
+    num_users, num_ads = links.shape
+
+    shapes = {
+        'user_sim': (num_users, num_users),
+        'ad_sim': (num_ads, num_ads),
+        'user_partial': (num_ads, num_users),
+        'ad_partial': (num_users, num_ads),
+    }
+    blocks, arrays = {}, {}
+    for key, shape in shapes.items():
+        blocks[key] = shared_memory.SharedMemory(create=True, size=max(1, 8 * shape[0] * shape[1]))
+        arrays[key] = np.ndarray(shape, dtype=np.float64, buffer=blocks[key].buf)
+    arrays['ad_sim'][:] = np.identity(num_ads)
+
+    if block_size is None:
+        block_size = max(1, -(-max(num_users, num_ads) // (4 * workers)))
+    user_tasks = split_rows('user', num_users, block_size)
+    ad_tasks = split_rows('ad', num_ads, block_size)
+
+    try:
+        buffers = {key: (blocks[key].name, shape) for key, shape in shapes.items()}
+        with Pool(workers, initializer=init_worker, initargs=(W_user, W_ad, C1, C2, buffers)) as pool:
+            for _ in range(iteration):
+                # User similarity updates
+                pool.map(propagate, user_tasks)
+                pool.map(combine, user_tasks)
+                np.fill_diagonal(arrays['user_sim'], 1.0)
+
+                # Ad similarity updates
+                pool.map(propagate, ad_tasks)
+                pool.map(combine, ad_tasks)
+                np.fill_diagonal(arrays['ad_sim'], 1.0)
+
+        user_sim = arrays['user_sim'].copy()
+        ad_sim = arrays['ad_sim'].copy()
+    finally:
+        del arrays
+        for block in blocks.values():
+            block.close()
+            block.unlink()
+
+    return user_sim, ad_sim
+
+
+def main(argv):
+    """
+    python3 parallel.py INPUT_FILE_NAME MAX_WORKERS
+
+    Time the serial and parallel SimRank with 1 to MAX_WORKERS workers
+    """
+    input_filename = argv[1]
+    max_workers = int(argv[2])
+
+    iteration = 10
+    C1, C2 = 0.8, 0.8
+    inputs, _, _ = read_input(input_filename)
+    users, ads, user_links, ad_links = parse_intput(inputs)
+
+    start_time = time.time()
+    user_sim, ad_sim = simrank_sparse(users, ads, user_links, ad_links, iteration, C1, C2)
+    serial_time = time.time() - start_time
+
+    print('Workers\tSeconds\tSpeedup\tExact')
+    print('serial', '\t', round(serial_time, 4), '\t', 1.0, '\t', True)
+    for workers in range(1, max_workers + 1):
+        start_time = time.time()
+        user_par, ad_par = simrank_parallel(users, ads, user_links, ad_links, iteration, C1, C2, workers)
+        elapsed = time.time() - start_time
+        exact = np.array_equal(user_sim, user_par) and np.array_equal(ad_sim, ad_par)
+        print(workers, '\t', round(elapsed, 4), '\t', round(serial_time / elapsed, 2), '\t', exact)
+
+
+if __name__ == "__main__":
+    main(sys.argv)
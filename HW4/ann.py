@@ -0,0 +1,185 @@
+import os
+import sys
+import time
+
+import numpy as np
+import scipy.sparse as sp
+
+from recommender import Recommender, csr_arrays, load_csr, read_input, save_arrays
+
+
+class ContentIndex(object):
+    """
+    Approximate nearest neighbor index of movies by content similarity
+
+    Only movies sharing a term with the query have a nonzero cosine
+    similarity, and the terms with the highest TF-IDF weights in the query
+    contribute most of it. The index keeps an inverted list of movies per
+    term, sorted by the weight of the term in each movie. A query takes
+    the num_terms highest weighted terms of its vector, the first
+    max_postings movies of each of their lists, and ranks these candidates
+    by exact cosine similarity. Raising num_terms or max_postings raises
+    the recall, and the candidates are at most num_terms * max_postings
+    movies whatever the size of the catalog.
+
+    Parameters
+    ----------
+    movie_ids : numpy.ndarray
+        Movie id of each row
+    vectors : scipy.sparse.csr_matrix
+        L2-normalized TF-IDF vectors, one row per movie
+    postings : scipy.sparse.csr_matrix
+        Transpose of vectors, one row per term, with the movies of each term
+        sorted by decreasing weight
+    """
+
+    def __init__(self, movie_ids, vectors, postings):
+        self.movie_ids = movie_ids
+        self.vectors = vectors
+        self.postings = postings
+        self.movie2row = {movie: row for row, movie in enumerate(movie_ids.tolist())}
+
+    @classmethod
+    def build(cls, recommender):
+        """Index the TF-IDF vectors of a recommender fitted with `compute_tfidf`
+        """
+        movie_ids = np.array(list(recommender.movie2row), dtype=np.int64)
+        norms = recommender.tfidf_norms
+        scale = np.divide(1., norms, out=np.zeros(len(norms)), where=norms > 0)
+        vectors = sp.csr_matrix(sp.diags(scale) @ recommender.tfidf)
+        vectors.sort_indices()
+
+        postings = vectors.T.tocsr()
+        terms = np.repeat(np.arange(postings.shape[0]), np.diff(postings.indptr))
+        order = np.lexsort((-postings.data, terms))
+        postings = sp.csr_matrix((postings.data[order], postings.indices[order], postings.indptr),
+                                 shape=postings.shape)
+        return cls(movie_ids, vectors, postings)
+
+    def save(self, path):
+        """Save the index to a directory of .npy files
+
+        An existing index at path is replaced as a whole, see `save_arrays`.
+        """
+        arrays = {'movie_ids': self.movie_ids}
+        arrays.update(csr_arrays('vectors', self.vectors))
+        arrays.update(csr_arrays('postings', self.postings))
+        save_arrays(path, arrays)
+
+    @classmethod
+    def load(cls, path):
+        """Load an index saved by `save`, memory-mapping its arrays read-only
+        """
+        arrays = {filename[:-4]: np.load(os.path.join(path, filename), mmap_mode='r')
+                  for filename in os.listdir(path) if filename.endswith('.npy')}
+        return cls(arrays['movie_ids'], load_csr('vectors', arrays), load_csr('postings', arrays))
+
+    def candidates(self, row, num_terms=20, max_postings=30):
+        """Return the rows in the first max_postings movies of the num_terms highest weighted terms of a row
+        """
+        start, end = self.vectors.indptr[row], self.vectors.indptr[row+1]
+        weights = self.vectors.data[start:end]
+        num_terms = min(num_terms, len(weights))
+        if num_terms == 0:
+            return np.array([], dtype=int)
+        terms = self.vectors.indices[start:end][np.argpartition(-weights, num_terms - 1)[:num_terms]]
+
+        starts = self.postings.indptr[terms]
+        lengths = np.minimum(self.postings.indptr[terms+1] - starts, max_postings)
+        positions = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths) + np.arange(lengths.sum())
+        return np.unique(self.postings.indices[positions])
+
+    def top_similar(self, query, k, num_terms=20, max_postings=30):
+        """Return about the k movies most similar in content to the query as (movie, similarity) pairs
+        """
+        row = self.movie2row[query]
+        rows = self.candidates(row, num_terms, max_postings)
+        rows = rows[rows != row]
+        return top_k(self.movie_ids, rows, self.similarities(row, rows), k)
+
+    def exact_top_similar(self, query, k):
+        """Return the k movies most similar in content to the query by comparing with every movie
+        """
+        row = self.movie2row[query]
+        rows = np.delete(np.arange(len(self.movie_ids)), row)
+        return top_k(self.movie_ids, rows, self.similarities(row, rows), k)
+
+    def similarities(self, row, rows):
+        return (self.vectors[rows] @ self.vectors[row].T).toarray().ravel()
+
+
+def top_k(ids, rows, sims, k):
+    """Return the k rows with the highest similarities as (id, similarity) pairs, ties broken by id
+    """
+    # Movies without terms have no similarity
+    rows, sims = rows[sims > 0], sims[sims > 0]
+    k = min(k, len(rows))
+    if k <= 0:
+        return []
+    top = np.argpartition(-sims, k - 1)[:k]
+    top = top[np.lexsort((ids[rows[top]], -sims[top]))]
+    return [(ids[rows[i]].item(), sims[i].item()) for i in top]
+
+
+def recall_report(index, settings, num_queries=300, k=10, seed=0):
+    """Print recall@k against exact cosine similarity, candidates and time per query for (num_terms, max_postings) settings
+
+    Recall counts a returned movie when its similarity is at least the k-th
+    highest exact similarity, so ties at the k-th place do not count as misses.
+    """
+    rng = np.random.default_rng(seed)
+    queries = rng.choice(index.movie_ids, num_queries, replace=False).tolist()
+    exact, exact_time = [], 0.
+    for query in queries:
+        start_time = time.time()
+        exact.append(index.exact_top_similar(query, k))
+        exact_time += time.time() - start_time
+    print(f'exact: {exact_time / num_queries:.6f}s per query')
+
+    print(f'Terms\tPostings\tRecall@{k}\tCandidates\tTime')
+    for num_terms, max_postings in settings:
+        hits = total = num_candidates = 0
+        ann_time = 0.
+        for query, exact_top in zip(queries, exact):
+            start_time = time.time()
+            approximate = index.top_similar(query, k, num_terms, max_postings)
+            ann_time += time.time() - start_time
+
+            num_candidates += len(index.candidates(index.movie2row[query], num_terms, max_postings))
+            if exact_top:
+                threshold = exact_top[-1][1] - 1e-12
+                hits += sum(sim >= threshold for _, sim in approximate)
+                total += len(exact_top)
+        print(num_terms, '\t', max_postings, '\t', round(hits / total, 4), '\t',
+              round(num_candidates / num_queries, 1), '\t', f'{ann_time / num_queries:.6f}s')
+
+
+def main(argv):
+    """
+    python3 ann.py build INPUT_FILE_NAME INDEX_DIR
+    python3 ann.py query INDEX_DIR MOVIE_ID
+    python3 ann.py report INPUT_FILE_NAME
+    """
+    command = argv[1]
+    topk = 10
+
+    if command in ('build', 'report'):
+        ratings, movies, _ = read_input(argv[2])
+        recommender = Recommender(ratings)
+        recommender.compute_tfidf(movies)
+        index = ContentIndex.build(recommender)
+        if command == 'build':
+            index.save(argv[3])
+        else:
+            settings = [(4, 100), (8, 100), (12, 100), (20, 100), (12, 30), (20, 30), (30, 30), (20, 1000)]
+            recall_report(index, settings)
+    elif command == 'query':
+        index = ContentIndex.load(argv[2])
+        for movie, similarity in index.top_similar(int(argv[3]), topk):
+            print(movie, '\t', similarity)
+    else:
+        print(main.__doc__)
+
+
+if __name__ == "__main__":
+    main(sys.argv)
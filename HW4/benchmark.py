@@ -0,0 +1,179 @@
+import sys
+import time
+
+import numpy as np
+
+from recommender import Recommender, read_input
+
+
+def timed(function, *args, **kwargs):
+    """Return the result of the call and the elapsed seconds
+    """
+    start_time = time.time()
+    result = function(*args, **kwargs)
+    return result, time.time() - start_time
+
+
+def fitted_recommender(ratings):
+    recommender = Recommender(ratings)
+    recommender.estimate_movie_biases()
+    recommender.estimate_user_biases()
+    return recommender
+
+
+def benchmark_neighbors(ratings, queries):
+    """Compare Pearson predictions from `pearson_correlation` with the precomputed model
+    """
+    print('===== Pearson neighborhood model =====')
+    scan = fitted_recommender(ratings)
+    _, elapsed = timed(lambda: [scan.predict(user, movie, 'pearson') for user, movie in queries])
+    print(f'pearson_correlation per query: {elapsed / len(queries):.4f}s')
+
+    for k in (None, 50):
+        model = fitted_recommender(ratings)
+        _, fit_time = timed(model.fit_neighbors, k)
+        _, elapsed = timed(lambda: [model.predict(user, movie, 'pearson') for user, movie in queries])
+        print(f'fit_neighbors(k={k}): {fit_time:.4f}s, {model.neighbors.nnz} neighbors, '
+              f'per query: {elapsed / len(queries):.6f}s')
+
+
+def benchmark_content(ratings, movies, queries):
+    """Compare the dense TF-IDF vectors with the sparse TF-IDF matrix
+    """
+    print('===== Content similarity =====')
+    recommender = fitted_recommender(ratings)
+    _, elapsed = timed(recommender.compute_tfidf, movies)
+    print(f'compute_tfidf: {elapsed:.4f}s')
+
+    tfidf = recommender.tfidf
+    dense_bytes = tfidf.shape[0] * tfidf.shape[1] * np.dtype(np.float64).itemsize
+    sparse_bytes = tfidf.data.nbytes + tfidf.indices.nbytes + tfidf.indptr.nbytes + recommender.tfidf_norms.nbytes
+    print(f'dense vectors: {dense_bytes / 2**20:.1f} MiB, sparse matrix: {sparse_bytes / 2**20:.1f} MiB')
+
+    pairs = [(movie, list(recommender.user_ratings[user])) for user, movie in queries]
+    num_pairs = sum(len(user_movies) for _, user_movies in pairs)
+    _, dense_time = timed(lambda: [
+        recommender.cosine_similarity(recommender.get_tfidf(movie), recommender.get_tfidf(user_movie))
+        for movie, user_movies in pairs for user_movie in user_movies])
+    _, sparse_time = timed(lambda: [
+        recommender.content_similarities(movie, user_movies) for movie, user_movies in pairs])
+    print(f'dense pairs per second: {num_pairs / dense_time:.0f}, '
+          f'batched sparse pairs per second: {num_pairs / sparse_time:.0f}')
+
+
+def benchmark_incremental(ratings, movies, queries, num_batches=10, held_out=0.05, k=50, num_predictions=2000):
+    """Compare `add_ratings` and `add_movies` in batches with fitting again on all the data
+
+    A fraction of the ratings and of the movies are held out of the first
+    fit and added in num_batches batches. Pearson predictions of
+    num_predictions random rated pairs and of the queries are compared too.
+    """
+    print(f'===== Incremental updates, k={k} =====')
+    rng = np.random.default_rng(0)
+    new_ratings = rng.random(len(ratings)) < held_out
+    movie_ids = list(movies)
+    new_movies = set(np.array(movie_ids)[rng.random(len(movie_ids)) < held_out].tolist())
+    initial_movies = {movie: movies[movie] for movie in movie_ids if movie not in new_movies}
+    added_movies = {movie: movies[movie] for movie in movie_ids if movie in new_movies}
+
+    model = fitted_recommender([rating for rating, new in zip(ratings, new_ratings) if not new])
+    model.compute_tfidf(initial_movies)
+    model.fit_neighbors(k)
+    batches = np.array_split(np.array(ratings)[new_ratings], num_batches)
+    movie_batches = np.array_split(np.array(list(added_movies)), num_batches)
+
+    rating_time = movie_time = 0.
+    for batch, movie_batch in zip(batches, movie_batches):
+        _, elapsed = timed(model.add_ratings, batch)
+        rating_time += elapsed
+        _, elapsed = timed(model.add_movies, {movie: added_movies[movie] for movie in movie_batch.tolist()})
+        movie_time += elapsed
+
+    def refit():
+        full = fitted_recommender(ratings)
+        full.compute_tfidf({**initial_movies, **added_movies})
+        full.fit_neighbors(k)
+        return full
+    full, refit_time = timed(refit)
+    print(f'{num_batches} batches of {len(batches[0])} ratings and {len(movie_batches[0])} movies, per batch: '
+          f'add_ratings {rating_time / num_batches:.4f}s, add_movies {movie_time / num_batches:.4f}s, '
+          f'fitting again: {refit_time:.4f}s')
+
+    # Compare by id, since the incremental model gives new ids the next indices
+    users, movie_rows = full.user_ids.tolist(), full.movie_ids.tolist()
+    print(f'mu: {abs(model.global_mean - full.global_mean):.2e}')
+    print(f'b_i: {max(abs(model.movie_biases[movie] - full.movie_biases[movie]) for movie in movie_rows):.2e}')
+    print(f'b_u: {max(abs(model.user_biases[user] - full.user_biases[user]) for user in users):.2e}')
+    print(f'idf: {np.abs(model.idf - full.idf).max():.2e}, '
+          f'tfidf: {abs(model.tfidf - full.tfidf).max():.2e}')
+
+    # Rows refreshed by the last batch are exact; ties among the k largest may pick other columns
+    order = np.array([model.movie_index[movie] for movie in movie_rows])
+    neighbors = model.neighbors[order][:, order]
+    last = sorted({full.movie_index[movie] for movie in batches[-1][:, 1].astype(int).tolist()})
+    errors = np.array([np.abs(np.sort(neighbors[row].data) - np.sort(full.neighbors[row].data)).max(initial=0.)
+                       if neighbors[row].nnz == full.neighbors[row].nnz else np.inf
+                       for row in range(len(movie_rows))])
+    print(f'neighbors of the {len(last)} movies of the last batch: {errors[last].max():.2e}, '
+          f'movies with stale neighbors: {(errors > 1e-6).sum()} of {len(movie_rows)}')
+
+    # Pearson predictions of random rated pairs and of the queries of the input
+    pairs = np.array(ratings)[rng.choice(len(ratings), num_predictions), :2].astype(int)
+    query_users = np.concatenate([pairs[:, 0], [user for user, _ in queries]])
+    query_movies = np.concatenate([pairs[:, 1], [movie for _, movie in queries]])
+    drift = np.abs(model.predict_batch(query_users, query_movies, 'pearson')
+                   - full.predict_batch(query_users, query_movies, 'pearson'))
+    print(f'pearson predictions of {len(drift)} queries against fitting again, median: {np.median(drift):.2e}, '
+          f'p95: {np.percentile(drift, 95):.2e}, max: {drift.max():.2e}, above 0.5: {(drift > 0.5).sum()}')
+
+
+def benchmark_recommend(ratings, ns=(10, 50, 100), held_out=0.1, k=50):
+    """Check the range of the scores of `recommend`, and how many held out ratings it recommends
+
+    A fraction of the ratings is held out of the fit. The unclipped scores
+    are checked against `rating_range`. For every n, the recommended movies
+    found among the user's held out ratings are counted as hits, over all
+    users: the hit rate is the fraction of users with a hit, and the recall
+    is the fraction of all held out ratings that are hits. The hits should
+    have a higher mean rating than all held out ratings.
+    """
+    print('===== Top-N recommendation =====')
+    rng = np.random.default_rng(0)
+    test = rng.random(len(ratings)) < held_out
+    model = fitted_recommender([rating for rating, new in zip(ratings, test) if not new])
+    _, fit_time = timed(model.fit_neighbors, k)
+    held = {(user, movie): score for (user, movie, score), new in zip(ratings, test) if new}
+
+    low, high = model.rating_range
+    users = model.user_ids.tolist()
+    recommendations, elapsed = timed(lambda: [model.recommend(user, max(ns), clip=False) for user in users])
+    values = np.array([score for user_recommendations in recommendations for _, score in user_recommendations[:min(ns)]])
+    print(f'fit_neighbors({k}): {fit_time:.4f}s, recommend {max(ns)} per user: {elapsed / len(users):.6f}s')
+    print(f'top-{min(ns)} scores before clipping: {len(values)}, min: {values.min():.3f}, max: {values.max():.3f}, '
+          f'outside [{low}, {high}]: {np.sum((values < low) | (values > high))}')
+
+    print(f'held out ratings: {len(held)}, mean: {np.mean(list(held.values())):.3f}')
+    print('N\tHits\tHit rate\tRecall\tMean of hits')
+    for n in ns:
+        hits = [[held[(user, movie)] for movie, _ in user_recommendations[:n] if (user, movie) in held]
+                for user, user_recommendations in zip(users, recommendations)]
+        all_hits = [score for user_hits in hits for score in user_hits]
+        print(n, '\t', len(all_hits), '\t', f'{np.mean([len(user_hits) > 0 for user_hits in hits]):.3f}', '\t',
+              f'{len(all_hits) / len(held):.4f}', '\t', f'{np.mean(all_hits):.3f}' if all_hits else '-')
+
+
+def main(argv):
+    """
+    python3 benchmark.py INPUT_FILE_NAME
+    """
+    input_filename = argv[1]
+    ratings, movies, queries = read_input(input_filename)
+    benchmark_neighbors(ratings, queries)
+    benchmark_content(ratings, movies, queries)
+    for k in (50, None):
+        benchmark_incremental(ratings, movies, queries, k=k)
+    benchmark_recommend(ratings)
+
+
+if __name__ == "__main__":
+    main(sys.argv)
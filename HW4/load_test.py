@@ -0,0 +1,85 @@
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import HTTPError, URLError
+from urllib.request import urlopen
+
+import numpy as np
+
+from recommender import read_input
+
+
+def sample_queries(ratings, num_requests, seed=None):
+    """Sample (user, movie) pairs with users and movies drawn in proportion to their number of ratings
+    """
+    rng = np.random.default_rng(seed)
+    users = np.array([user for user, _, _ in ratings])
+    movies = np.array([movie for _, movie, _ in ratings])
+    return list(zip(rng.choice(users, num_requests).tolist(), rng.choice(movies, num_requests).tolist()))
+
+
+def timed_request(url):
+    """Return the latency of a GET request in seconds and whether it succeeded
+    """
+    start_time = time.perf_counter()
+    try:
+        with urlopen(url) as response:
+            response.read()
+        ok = True
+    except (HTTPError, URLError, OSError):
+        # Error statuses, and refused, reset or timed out connections
+        ok = False
+    return time.perf_counter() - start_time, ok
+
+
+def run_requests(urls, concurrency):
+    """Send the requests from concurrency threads and return their latencies, the number of errors and the throughput
+    """
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        results = list(executor.map(timed_request, urls))
+    elapsed = time.perf_counter() - start_time
+    latencies = np.array([latency for latency, _ in results])
+    return latencies, sum(not ok for _, ok in results), len(urls) / elapsed
+
+
+def main(argv):
+    """
+    python3 load_test.py INPUT_FILE_NAME URL [NUM_REQUESTS] [CONCURRENCY]
+
+    Send NUM_REQUESTS requests to each endpoint of a running server.py, one
+    endpoint after the other: Pearson predictions, content predictions and
+    top-10 recommendations. Report the latency percentiles of each endpoint
+    and the similarity cache counters.
+    """
+    input_filename = argv[1]
+    base_url = argv[2].rstrip('/')
+    num_requests = int(argv[3]) if len(argv) > 3 else 1000
+    concurrency = int(argv[4]) if len(argv) > 4 else 8
+
+    ratings, _, _ = read_input(input_filename)
+    queries = sample_queries(ratings, num_requests)
+    endpoints = [
+        ('predict pearson', [f'{base_url}/predict?user={user}&movie={movie}&similarity=pearson'
+                             for user, movie in queries]),
+        ('predict content', [f'{base_url}/predict?user={user}&movie={movie}&similarity=content'
+                             for user, movie in queries]),
+        ('recommend', [f'{base_url}/recommend?user={user}&n=10' for user, _ in queries]),
+    ]
+
+    print(f'requests: {num_requests} per endpoint, concurrency: {concurrency}')
+    print('Endpoint\tErrors\tThroughput\tp50\tp99')
+    for name, urls in endpoints:
+        latencies, errors, throughput = run_requests(urls, concurrency)
+        print(name, '\t', errors, '\t', f'{throughput:.1f}/s', '\t',
+              f'{np.percentile(latencies, 50) * 1000:.2f}ms', '\t', f'{np.percentile(latencies, 99) * 1000:.2f}ms')
+
+    with urlopen(f'{base_url}/stats') as response:
+        stats = json.load(response)
+    print(f"cache: {stats['size']}/{stats['maxsize']} rows, hits: {stats['hits']}, "
+          f"misses: {stats['misses']}, hit rate: {stats['hit_rate']:.3f}")
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,183 @@
+import json
+import sys
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from recommender import Recommender
+
+
+class SimilarityCache(object):
+    """
+    Bounded LRU cache of movie similarity rows
+
+    An entry holds the similarities of one movie with every movie of the
+    model, keyed by (similarity, movie), so that every later prediction for
+    the movie reads its weights from the row whoever the user is. The least
+    recently used row is dropped once the cache holds more than maxsize rows.
+    The cache is safe to share between threads; two threads missing the same
+    row may both compute it.
+
+    Parameters
+    ----------
+    maxsize : int
+        Maximum number of cached rows
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, compute):
+        """Return the cached row of a key, or compute(*key) on a miss
+        """
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+            self.misses += 1
+
+        value = compute(*key)
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+        return value
+
+    def clear(self):
+        """Drop every cached row, e.g. after the ratings or the metadata changed
+        """
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self.entries),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.,
+            }
+
+
+class RecommendServer(ThreadingHTTPServer):
+    """
+    HTTP server answering rating and top-N requests from one loaded model
+
+    Each request runs in its own thread. Pearson predictions use the
+    neighborhood model when the model has one. Content predictions, and
+    Pearson predictions without a neighborhood model, read the similarity
+    row of the target movie through the similarity cache.
+
+    Parameters
+    ----------
+    address : tuple
+        (host, port) to listen on
+    recommender : Recommender
+        Model with biases, and TF-IDF for content predictions
+    cache_size : int
+        Maximum number of cached similarity rows
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, recommender, cache_size):
+        super().__init__(address, RecommendHandler)
+        self.recommender = recommender
+        self.cache = SimilarityCache(cache_size)
+        self.recommender.similarity_cache = self.cache
+
+        # Build the lookups a loaded model builds on first use before threads share it
+        self.recommender.user_ratings
+        self.recommender.movie_raters
+        if self.recommender.neighbors is not None:
+            self.recommender.reverse_neighbors
+        if 'tfidf' in self.recommender.__dict__:
+            self.recommender.tfidf_transpose
+
+    def predict(self, user, movie, similarity):
+        if similarity not in ('pearson', 'content'):
+            raise ValueError(f"similarity must be 'pearson' or 'content', not {similarity}")
+        return self.recommender.predict(user, movie, similarity)
+
+    def recommend(self, user, n):
+        # Fitting the neighborhood model on demand would block every request for seconds
+        if self.recommender.neighbors is None:
+            raise ValueError('top-N requests need a model fitted with fit_neighbors')
+        return self.recommender.recommend(user, n)
+
+
+class RecommendHandler(BaseHTTPRequestHandler):
+    """
+    GET /predict?user=USER&movie=MOVIE&similarity=pearson|content
+    GET /recommend?user=USER&n=N
+    GET /stats
+    """
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        try:
+            if url.path == '/predict':
+                user, movie = int(params['user']), int(params['movie'])
+                similarity = params.get('similarity', 'pearson')
+                rating = self.server.predict(user, movie, similarity)
+                self.send_json(200, {'user': user, 'movie': movie, 'rating': rating})
+            elif url.path == '/recommend':
+                user, n = int(params['user']), int(params.get('n', 10))
+                movies = self.server.recommend(user, n)
+                self.send_json(200, {'user': user, 'movies': [movie for movie, _ in movies],
+                                     'ratings': [rating for _, rating in movies]})
+            elif url.path == '/stats':
+                self.send_json(200, self.server.cache.stats())
+            else:
+                self.send_json(404, {'error': f'unknown path {url.path}'})
+        except KeyError as error:
+            self.send_json(400, {'error': f'unknown user, movie or parameter {error}'})
+        except ValueError as error:
+            self.send_json(400, {'error': str(error)})
+
+    def send_json(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        # Keep the console quiet under load
+        pass
+
+
+def main(argv):
+    """
+    python3 server.py MODEL_DIR [PORT] [CACHE_SIZE]
+
+    Serve a model saved with `Recommender.save` on localhost
+    """
+    model_path = argv[1]
+    port = int(argv[2]) if len(argv) > 2 else 8000
+    cache_size = int(argv[3]) if len(argv) > 3 else 1000
+
+    recommender = Recommender.load(model_path)
+    server = RecommendServer(('127.0.0.1', port), recommender, cache_size)
+    print(f'Serving {model_path} on http://127.0.0.1:{port}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main(sys.argv)